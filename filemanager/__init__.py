@@ -2,4 +2,4 @@
 
 # __init__.py
 
-__all__ = [ "logger", "filemanager", "hashchecker"]
\ No newline at end of file
+__all__ = [ "logger", "filemanager", "hashchecker", "iouring_backend", "manifest"]
\ No newline at end of file
@@ -1,100 +1,377 @@
 import os
+import sys
+import stat
+import errno
 import shutil
 import logging
+import functools
 from tqdm import tqdm
 import pwd
 import grp
+import queue
+import threading
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from filemanager import iouring_backend
 
 
+# Largest block handed to copy_file_range/sendfile in a single call
+SENDFILE_CHUNK = 16 * 1024 * 1024
+
+# Size of the blocks read and written when the kernel cannot copy for us
+COPY_CHUNK = 8 * 1024 * 1024
+
+# Whether chown accepts a directory descriptor here
+DIR_FD_CHOWN = os.chown in os.supports_dir_fd
+
+# Files at least this large get readahead and page cache hints when copied
+FADVISE_MIN_SIZE = 1024 * 1024
+
+# Errors after which no other copy to the same destination can succeed
+OUT_OF_SPACE = (errno.ENOSPC, errno.EDQUOT)
+
+# Directories' worth of files the walker may read ahead of its caller
+WALK_QUEUE_SIZE = 256
+
 
 def split_path(path, root):
   """
   Splits a path into its directory and filename components,
   removing the root and returning the remaining path as a string.
   """
-  # Step 1: Split the path into components
-  components = path.split('/')
-  
-  # Step 2: Determine how many components to remove based on the root
-  to_remove = len(root.split('/'))
-  
-  # Step 3: Remove the root components
-  remaining_components = components[to_remove:]
-  
-  # Step 4: Join the remaining components into a single string
-  result = '/'.join(remaining_components)
-  
-  # Step 5: Return the joined string
-  return result
+  # Paths produced by walking root always start with it, so a slice is enough
+  if path.startswith(root):
+      return path[len(root):].lstrip('/')
+  return os.path.relpath(path, root)
 
 
-def ch_own(root_dir,chown_list = None):
-    """
-    Changes the owner and group of a file or directory.
-    """
-    if chown_list is not None:
-        gid=get_uid_gid(chown_list)[1]
-        uid=get_uid_gid(chown_list)[0]
-        for root, dirs, files in os.walk(root_dir):
-            for dir_name in dirs:
-                dir_path = os.path.join(root, dir_name)
-                logging.debug(f"subfolders: {dir_path}")
-                try:
-                    os.chown(dir_path, uid, gid)
-                    logging.debug(f"User ID {uid}, Group ID {gid} applied to: {dir_path}")
-                except Exception as e:
-                    logging.error(f"Failed to change user or group for {dir_path}: {e}")
-        
-
 def src2dst(src_file, src_dir, dst_dir):
   '''
   Converts a source file path to a destination file path.
   '''
-  logging.debug(f"Converts a source file path to a destination file path. {src_file}")
+  logging.debug("Converts a source file path to a destination file path. %s", src_file)
   file_part = split_path(src_file, src_dir)
   return f"{dst_dir}/{file_part}"
         
 
-def list_files_recursively(directory):
+def default_walk_threads():
+  """
+  Returns the number of threads used to walk a directory tree.
+
+  On macOS the count is capped to 4, since readdir calls on the same APFS
+  volume serialise on a volume lock and more threads only add contention.
+  """
+  count = os.cpu_count() or 1
+  if sys.platform == "darwin":
+      return min(count, 4)
+  return count
+
+
+def iter_files_recursively(directory, threads=None, manifest=None):
+  """
+  Yields all files in a directory and its subdirectories, walked by several threads.
+
+  Each worker owns a private deque of pending directories: it pops the
+  newest one from its own deque, walking its part of the tree depth-first
+  for locality, and when that is empty steals the oldest one from a peer.
+  The files of each directory are yielded next to each other, as soon as
+  the directory has been read, so callers can start working on them while
+  the rest of the tree is still being walked. A bounded queue between the
+  workers and the caller keeps memory flat when the caller is slower.
+
+  Directories are read with os.scandir and classified from the d_type
+  cached on each DirEntry, so no extra stat() is needed per file, and the
+  DirEntry objects themselves are yielded so callers can use their path
+  and cached stat() without another lookup. Symlinks to directories are
+  skipped, as os.walk did.
+
+  With a manifest, folders whose mtime has not changed since the last run
+  are listed from it instead of being read, and their files are yielded as
+  manifest.CachedEntry objects. The manifest is saved once the whole tree
+  has been walked.
+
+  Parameters:
+  directory (str): The path to the directory to list files from.
+  threads (int): The number of worker threads (default: default_walk_threads()).
+  manifest (Manifest): The stored listings of this tree, if any.
+
+  Yields:
+  os.DirEntry: One entry per file.
+  """
+  threads = max(1, threads or default_walk_threads())
+  logging.info(f"Reading files from {directory}...")
+
+  queues = [deque() for _ in range(threads)]
+  queues[0].append(directory)
+  # Batches of files, one per directory, then None once the walk is over;
+  # an exception raised by a worker is passed on in place of a batch
+  batches = queue.Queue(maxsize=WALK_QUEUE_SIZE)
+  stopped = threading.Event()
+  # Guards the tasks counter; idle workers wait on it for new directories
+  on_input = threading.Condition()
+  # Number of directories queued or being scanned
+  tasks = 1
+
+  def take(index):
+      # Pop the newest directory from our own deque, or steal the oldest one
+      try:
+          return queues[index].pop()
+      except IndexError:
+          pass
+      for offset in range(1, threads):
+          try:
+              return queues[(index + offset) % threads].popleft()
+          except IndexError:
+              continue
+      return None
+
+  def read(path):
+      subdirs = []
+      files = []
+      with os.scandir(path) as entries:
+          for entry in entries:
+              if entry.is_dir(follow_symlinks=False):
+                  subdirs.append(entry.path)
+              elif not entry.is_dir():
+                  logging.debug("File found: %s", entry.path)
+                  files.append(entry)
+      return subdirs, files
+
+  def listing(path):
+      subdirs = []
+      files = []
+      try:
+          if manifest is None:
+              subdirs, files = read(path)
+          else:
+              # Taken before reading, so a change made meanwhile shows next time
+              mtime_ns = os.stat(path).st_mtime_ns
+              listing = manifest.lookup(path, mtime_ns)
+              if listing is None:
+                  subdirs, files = read(path)
+                  manifest.record(path, mtime_ns, subdirs, files)
+              else:
+                  subdirs, files = listing
+                  # Symlinks may point to a folder by now
+                  files = [entry for entry in files if not entry.is_dir()]
+      except OSError as e:
+          logging.error(f"Error listing files: {e}")
+      return subdirs, files
+
+  def scan(index, path):
+      nonlocal tasks
+      subdirs = []
+      try:
+          subdirs, files = listing(path)
+          # Hand the folder's files over in one go, so they stay together
+          if files:
+              batches.put(files)
+      except BaseException as e:
+          # Re-raised by the caller; the folder still counts as scanned, or
+          # the other workers and the caller would wait for it forever
+          subdirs = []
+          batches.put(e)
+      finally:
+          with on_input:
+              tasks += len(subdirs) - 1
+              queues[index].extend(subdirs)
+              done = tasks == 0
+              if done:
+                  on_input.notify_all()
+              elif subdirs:
+                  on_input.notify(len(subdirs))
+      if done:
+          batches.put(None)
+
+  def worker(index):
+      while not stopped.is_set():
+          path = take(index)
+          if path is not None:
+              scan(index, path)
+              continue
+          with on_input:
+              while tasks and not any(queues) and not stopped.is_set():
+                  on_input.wait()
+              if not tasks:
+                  return
+
+  count = 0
+  if threads == 1:
+      # A single worker gains nothing from a thread of its own, nor from
+      # the queue: walk depth-first inline, as it would
+      pending = [directory]
+      while pending:
+          subdirs, files = listing(pending.pop())
+          pending.extend(subdirs)
+          count += len(files)
+          yield from files
+      if manifest is not None:
+          manifest.save()
+      logging.debug("Total files found: %s", count)
+      logging.info(f"Files from {directory} have been read.")
+      return
+
+  workers = [threading.Thread(target=worker, args=(index,), daemon=True)
+             for index in range(threads)]
+  for thread in workers:
+      thread.start()
+
+  try:
+      while True:
+          files = batches.get()
+          if files is None:
+              break
+          if isinstance(files, BaseException):
+              raise files
+          count += len(files)
+          yield from files
+      if manifest is not None:
+          manifest.save()
+  finally:
+      # The caller may stop early: wake the workers and drain the queue
+      # until they have all seen the stop flag
+      stopped.set()
+      with on_input:
+          on_input.notify_all()
+      while any(thread.is_alive() for thread in workers):
+          try:
+              batches.get(timeout=0.05)
+          except queue.Empty:
+              pass
+
+  logging.debug("Total files found: %s", count)
+  logging.info(f"Files from {directory} have been read.")
+
+
+def list_files_recursively(directory, threads=None, manifest=None):
   """
   Lists all files in a directory and its subdirectories using multithreading.
 
   Parameters:
   directory (str): The path to the directory to list files from.
+  threads (int): The number of worker threads (default: default_walk_threads()).
+  manifest (Manifest): The stored listings of this tree, if any.
 
   Returns:
-  list: A list of file paths.
+  list: A list of os.DirEntry objects, one per file, as yielded by
+  iter_files_recursively().
   """
-  file_list = []
-  try:
-      logging.info(f"Reading files from {directory}...")
-
-      # Define a function to process each directory
-      def process_directory(root, files):
-          local_file_list = []
-          for file in files:
-              file_path = os.path.join(root, file)
-              local_file_list.append(file_path)
-              logging.debug(f"File found: {file_path}")
-          return local_file_list
-
-      # Use ThreadPoolExecutor to process directories in parallel
-      with ThreadPoolExecutor() as executor:
-          futures = []
-          for root, _, files in os.walk(directory):
-              futures.append(executor.submit(process_directory, root, files))
-
-          for future in as_completed(futures):
-              file_list.extend(future.result())
-
-      logging.debug(f"Total files found: {len(file_list)}")
-      logging.info(f"Files from {directory} have been read.")
-  except Exception as e:
-      logging.error(f"Error listing files: {e}")
-  return file_list
+  return list(iter_files_recursively(directory, threads, manifest))
 
 
+def open_source(path):
+  """
+  Opens a file for reading and returns its descriptor.
+
+  O_NOATIME is used where the kernel allows it (Linux, for files we own), so
+  reading the file for a copy does not cost an atime update write.
+  """
+  flags = os.O_RDONLY | getattr(os, "O_CLOEXEC", 0)
+  if hasattr(os, "O_NOATIME"):
+      try:
+          return os.open(path, flags | os.O_NOATIME)
+      except PermissionError:
+          pass
+  return os.open(path, flags)
+
+
+def copy_fd(src_fd, dst_fd, progress=None):
+  """
+  Copies all data from src_fd to dst_fd, in the kernel when possible.
+
+  os.copy_file_range is tried first (it can reflink on the same filesystem),
+  then os.sendfile; both avoid bouncing the data through a Python buffer.
+  If the kernel rejects them for these files (e.g. EXDEV across filesystems,
+  EINVAL, or ENOTSOCK for sendfile outside Linux) before anything was
+  written, a plain read/write loop is used instead. Either way the copy
+  runs to EOF, so a file that grew since it was listed is copied whole.
+
+  Parameters:
+  src_fd (int): File descriptor to read from, positioned at its start.
+  dst_fd (int): File descriptor to write to.
+  progress (callable): Called with the number of bytes copied after each chunk.
+  """
+  for name in ("copy_file_range", "sendfile"):
+      if not hasattr(os, name):
+          continue
+      offset = 0
+      try:
+          while True:
+              if name == "copy_file_range":
+                  sent = os.copy_file_range(src_fd, dst_fd, SENDFILE_CHUNK, offset)
+              else:
+                  sent = os.sendfile(dst_fd, src_fd, offset, SENDFILE_CHUNK)
+              if sent == 0:
+                  return
+              offset += sent
+              if progress is not None:
+                  progress(sent)
+      except OSError as e:
+          # Only give up on the fast path if nothing has been written yet
+          if offset or e.errno == errno.ENOSPC:
+              raise
+          logging.debug("%s not usable, falling back: %s", name, e)
+
+  # Read and write the file in chunks
+  for chunk in iter(lambda: os.read(src_fd, COPY_CHUNK), b''):
+      view = memoryview(chunk)
+      while view:
+          view = view[os.write(dst_fd, view):]
+      if progress is not None:
+          progress(len(chunk))
+
+
+def is_out_of_space(error):
+  """
+  Tells whether an exception means the destination has run out of space or quota.
+  """
+  return isinstance(error, OSError) and error.errno in OUT_OF_SPACE
+
+
+def fadvise(fd, advice):
+  """
+  Gives the kernel an access pattern hint for fd, where posix_fadvise exists.
+  """
+  if hasattr(os, "posix_fadvise"):
+      try:
+          os.posix_fadvise(fd, 0, 0, advice)
+      except OSError as e:
+          logging.debug("posix_fadvise failed: %s", e)
+
+
+def copy_data(src_fd, dst_fd, progress=None, size=None):
+  """
+  Copies all data from src_fd to dst_fd like copy_fd, with page cache hints.
+
+  For files of FADVISE_MIN_SIZE or more, the source is marked sequential,
+  which widens the kernel's readahead window. Afterwards both files are
+  marked DONTNEED: a one-shot sync does not read them again, and keeping
+  them cached would evict everything else on the host. Smaller files are
+  copied without the extra syscalls.
+  """
+  advise = hasattr(os, "posix_fadvise") and size is not None and size >= FADVISE_MIN_SIZE
+  if advise:
+      fadvise(src_fd, os.POSIX_FADV_SEQUENTIAL)
+  copy_fd(src_fd, dst_fd, progress)
+  if advise:
+      fadvise(src_fd, os.POSIX_FADV_DONTNEED)
+      fadvise(dst_fd, os.POSIX_FADV_DONTNEED)
+
+
+@functools.lru_cache(maxsize=1024)
+def lookup_uid_gid(user, group):
+    '''
+    Returns the uid and gid of a user and group name, -1 for a missing name.
+
+    Results are cached, so pwd/grp (and the NSS backends behind them, such as
+    LDAP or SSSD) are queried once per name.
+    '''
+    uid = pwd.getpwnam(user).pw_uid if user is not None else -1
+    gid = grp.getgrnam(group).gr_gid if group is not None else -1
+    return uid, gid
+
+
+@functools.lru_cache(maxsize=1024)
 def get_uid_gid(user_group):
     '''
     Pass user and group name and return uid and gid, ex. www-data:www-data
@@ -102,10 +379,6 @@ def get_uid_gid(user_group):
     try:
         parts = user_group.split(':')
         
-        # Initialize uid and gid
-        uid = None
-        gid = None
-        
         # Assign values based on the number of parts
         if len(parts) == 2:
             user, group = parts[0] or None, parts[1] or None
@@ -115,16 +388,7 @@ def get_uid_gid(user_group):
         else:
             raise ValueError("Input should be in 'user:group' format")
         
-        if user is not None:
-            uid = pwd.getpwnam(user).pw_uid
-        else:
-            uid = -1
-        if group is not None:
-            gid = grp.getgrnam(group).gr_gid
-        else:
-            gid = -1
-        
-        return uid, gid
+        return lookup_uid_gid(user, group)
     
     except KeyError as e:
         return f"Error: {e} not found"
@@ -162,36 +426,14 @@ def files_match(file_path1, file_path2):
       return False
 
 
-# def sizes_equal(file_path1, file_path2):
-#   """
-#   Returns True if the sizes of the two files are equal, False otherwise.
-
-#   Args:
-#       file_path1 (str): Path to the first file.
-#       file_path2 (str): Path to the second file.
-
-#   Returns:
-#       bool: Whether the file sizes are equal.
-#   """
-#   try:
-#       size1 = os.path.getsize(file_path1)
-#       size2 = os.path.getsize(file_path2)
-#       if size1 == size2:
-#           logging.debug("the file sizes are equal")    
-#           return True
-#       else:
-#           logging.debug("the file sizes aren't equal")    
-#           return False
-#   except FileNotFoundError:
-#       logging.error("One or both files not found.")
-#       return False
-
-
 class FileManager:
   """
   A class to manage file operations such as copying files and preserving file attributes.
   """
 
+  # Destination directories already created, shared by every FileManager
+  _created_dirs = set()
+
   def __init__(self, 
                src_file,
                dst_file, 
@@ -199,7 +441,8 @@ class FileManager:
                preserve_permissions = False, 
                group = None, 
                owner = None, 
-               status_bar = False):
+               status_bar = False,
+               src_stat = None):
       """
       Initializes the FileManager with source and destination file paths.
 
@@ -209,6 +452,7 @@ class FileManager:
       preserve_permissions (bool): If True, preserves the file's permissions.
       group (int): Change the file's group ID
       owner (int): Change the file's owner ID.
+      src_stat (os.stat_result): The source file's stat, if already known (e.g. from DirEntry.stat()).
   
       """
       self.src_file = src_file
@@ -218,6 +462,27 @@ class FileManager:
       self.group =  group 
       self.owner =  owner
       self.root_dir = root_dir
+      self.src_stat = src_stat
+
+  @classmethod
+  def make_dirs(cls, dst_dir):
+    """
+    Creates a destination directory and its parents, once per process.
+
+    Directories created earlier are remembered, so copying many files into
+    the same folder costs one mkdir instead of one per file.
+    """
+    if dst_dir not in cls._created_dirs:
+        os.makedirs(dst_dir, exist_ok=True)
+        cls._created_dirs.add(dst_dir)
+
+  def source_stat(self):
+    """
+    Returns the stat of the source file, reusing the one given at init.
+    """
+    if self.src_stat is None:
+        self.src_stat = os.stat(self.src_file)
+    return self.src_stat
 
   def copy_metadata(self):
     # Define the source and destination file paths
@@ -225,7 +490,7 @@ class FileManager:
     dst_file = self.dst_file
 
     # Get the original file's timestamps
-    stat_info = os.stat(src_file)
+    stat_info = self.source_stat()
     atime = stat_info.st_atime
     mtime = stat_info.st_mtime
     ctime = stat_info.st_ctime
@@ -248,108 +513,298 @@ class FileManager:
 
 
 
+  def source_is_regular(self):
+    """
+    Tells whether the source is a regular file, logging an error otherwise.
+
+    Special files are refused as shutil.copy2 does: opening a named pipe
+    for reading would block until a writer shows up, hanging the copy.
+    """
+    mode = self.source_stat().st_mode
+    if stat.S_ISREG(mode):
+        return True
+    if stat.S_ISFIFO(mode):
+        logging.error(f"Error copying file: `{self.src_file}` is a named pipe")
+    else:
+        logging.error(f"Error copying file: `{self.src_file}` is not a regular file")
+    return False
+
   def copy_file(self):
     """
     Copies the source file to the destination path, preserving metadata, with a progress bar.
     """
     try:
+        if not self.source_is_regular():
+            return
         dst_dir = os.path.dirname(self.dst_file)
-        os.makedirs(dst_dir, exist_ok=True)
+        self.make_dirs(dst_dir)
         if self.status_bar:
             try:
                 # Determine the size of the source file
-                file_size = os.path.getsize(self.src_file)
+                file_size = self.source_stat().st_size
 
-                # Open the source and destination files
-                with open(self.src_file, 'rb') as src_file, open(self.dst_file, 'wb') as dst_file:
-                    # Set up the progress bar
-                    if len(self.dst_file) > 110:
-                        description = f"...{self.dst_file[-107:]}"
-                    else:
-                        description = f"{self.dst_file[-110:]}"
+                # Set up the progress bar description
+                if len(self.dst_file) > 110:
+                    description = f"...{self.dst_file[-107:]}"
+                else:
+                    description = self.dst_file
 
+                # Open the source and destination files
+                with open(open_source(self.src_file), 'rb') as src_file, open(self.dst_file, 'wb') as dst_file:
+                    # Refresh a few times per second at most, not on every chunk
                     with tqdm(total=file_size, 
                               unit='B', 
                               unit_scale=True, 
-                              desc=f"{description}", 
+                              desc=description, 
                             #   desc=f"{self.dst_file.split('/')[-1]}", 
                               unit_divisor=1024,
+                              mininterval=0.25,
+                              miniters=4 * 1024 * 1024,
                               bar_format="{desc:<110} {bar} [ {n_fmt:>5}/{total_fmt:>5} | {percentage:>6.2f} % | {rate_fmt:>8} ]",
                               dynamic_ncols = True) as pbar:
                             #   ncols=220) as pbar:
                         
-                        # Read and write the file in chunks
-                        for chunk in iter(lambda: src_file.read(1024 * 1024), b''):
-                            dst_file.write(chunk)
-                            pbar.update(len(chunk))
+                        # Copy the file in chunks, in the kernel when possible
+                        copy_data(src_file.fileno(), dst_file.fileno(), pbar.update, file_size)
 
-                logging.debug(f"File copied from {self.src_file} to {self.dst_file}")
+                # Keep the timestamps, so the next run sees the file as unchanged
+                shutil.copystat(self.src_file, self.dst_file)
+
+                logging.debug("File copied from %s to %s", self.src_file, self.dst_file)
 
             except Exception as e:
+                if is_out_of_space(e):
+                    raise
                 logging.error(f"Error copying file with progress bar: {e}")
 
         else:
             try:
-                # Copy the file and its metadata
-                shutil.copy2(self.src_file, self.dst_file)
+                # Copy the data in the kernel, then the metadata, as shutil.copy2 would
+                with open(open_source(self.src_file), 'rb', buffering=0) as src_file, \
+                     open(self.dst_file, 'wb', buffering=0) as dst_file:
+                    copy_data(src_file.fileno(), dst_file.fileno(), size=self.source_stat().st_size)
+                shutil.copystat(self.src_file, self.dst_file)
                 logging.info(f"{self.src_file} => {self.dst_file}")
             except Exception as e:
+                if is_out_of_space(e):
+                    raise
                 logging.error(f"Error copying file: {e}")
-        
-        if self.preserve_permissions: 
-            shutil.copystat(self.src_file, self.dst_file)
-            logging.debug(f"Permissions applied: {self.dst_file}")
-
-        # Apply preserved group ID
-        if self.group is not None:
-            os.chown(self.dst_file, -1, self.group)
-            logging.debug(f"Group ID applied: {self.dst_file}")
-        
-        # Apply preserved owner ID
-        if self.owner is not None:
-            os.chown(self.dst_file, self.owner, -1)
-            logging.debug(f"Owner ID applied: {self.dst_file}")
-            
+
+        self.apply_attributes()
 
     except Exception as e:
+        # A full disk fails every copy that follows: let the caller stop the run
+        if is_out_of_space(e):
+            raise
         logging.error(f"Error setting up directories: {e}")
 
 
+  def apply_attributes(self):
+    """
+    Applies the preserved group and owner to the destination file.
+
+    The permissions, times and extended attributes that preserve_permissions
+    asks for are not set again here: every copy path has already run
+    shutil.copystat on the file. The chown is made with the file's base
+    name relative to its directory, so the kernel does not resolve the
+    full path again.
+    """
+    if self.group is None and self.owner is None:
+        return
+    if not DIR_FD_CHOWN:
+        return self._apply_attributes_by_path()
+
+    dir_fd = os.open(os.path.dirname(self.dst_file) or ".", os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        # Apply preserved owner and group IDs in a single call
+        os.chown(os.path.basename(self.dst_file),
+                 self.owner if self.owner is not None else -1,
+                 self.group if self.group is not None else -1,
+                 dir_fd=dir_fd)
+        logging.debug("Owner ID %s, Group ID %s applied: %s", self.owner, self.group, self.dst_file)
+    finally:
+        os.close(dir_fd)
+
+  def _apply_attributes_by_path(self):
+    """
+    Applies the preserved group and owner using full paths, where dir_fd is not supported.
+    """
+    # Apply preserved group ID
+    if self.group is not None:
+        os.chown(self.dst_file, -1, self.group)
+        logging.debug("Group ID applied: %s", self.dst_file)
+    
+    # Apply preserved owner ID
+    if self.owner is not None:
+        os.chown(self.dst_file, self.owner, -1)
+        logging.debug("Owner ID applied: %s", self.dst_file)
+
+
+  def copy_many(self, pairs, max_workers=32, backend="threads"):
+    """
+    Copies many files at once across a bounded thread pool.
+
+    Each (src, dst) pair is copied with its metadata like copy_file does
+    without a progress bar, then gets this FileManager's permissions, group
+    and owner settings. Pairs are submitted in source inode order, which
+    keeps reads close together on disk. When status_bar is set, a single
+    aggregate progress bar replaces the per-file ones.
+
+    With backend="iouring" the data is copied through io_uring instead (see
+    iouring_backend); the thread pool is used when it is not available.
+
+    Like copy_file, errors are logged per file, except running out of
+    space or quota: that is raised, once the copies not yet started have
+    been cancelled.
+
+    Parameters:
+    pairs (iterable): (source path, destination path) tuples.
+    max_workers (int): The maximum number of concurrent copies.
+    backend (str): "threads" or "iouring".
+    """
+    jobs = []
+    for src_file, dst_file in pairs:
+        try:
+            jobs.append((os.stat(src_file), src_file, dst_file))
+        except OSError as e:
+            logging.error(f"Error reading {src_file}: {e}")
+    jobs.sort(key=lambda job: job[0].st_ino)
+
+    pbar = None
+    if self.status_bar:
+        pbar = tqdm(total=sum(job[0].st_size for job in jobs),
+                    unit='B',
+                    unit_scale=True,
+                    unit_divisor=1024,
+                    desc=f"{len(jobs)} files",
+                    dynamic_ncols = True)
+
+    if backend == "iouring" and not iouring_backend.available():
+        logging.debug("io_uring is not available, copying with threads")
+        backend = "threads"
+
+    def attributes_of(src_file, dst_file):
+        return FileManager(src_file,
+                           dst_file,
+                           root_dir=self.root_dir,
+                           preserve_permissions=self.preserve_permissions,
+                           group=self.group,
+                           owner=self.owner)
+
+    def copy_one(stat_info, src_file, dst_file):
+        try:
+            self.make_dirs(os.path.dirname(dst_file))
+            # Copy the file and its metadata
+            shutil.copyfile(src_file, dst_file)
+            shutil.copystat(src_file, dst_file)
+            attributes_of(src_file, dst_file).apply_attributes()
+            logging.info(f"{src_file} => {dst_file}")
+        except Exception as e:
+            # A full disk fails every copy that follows: stop the batch
+            if is_out_of_space(e):
+                raise
+            logging.error(f"Error copying file: {e}")
+        if pbar is not None:
+            pbar.update(stat_info.st_size)
+
+    try:
+        if backend == "iouring":
+            for dst_dir in {os.path.dirname(job[2]) for job in jobs}:
+                self.make_dirs(dst_dir)
+            copied = iouring_backend.copy_many([job[1:] for job in jobs],
+                                               progress=pbar.update if pbar is not None else None)
+            for src_file, dst_file in copied:
+                try:
+                    attributes_of(src_file, dst_file).apply_attributes()
+                    logging.info(f"{src_file} => {dst_file}")
+                except Exception as e:
+                    logging.error(f"Error applying attributes to {dst_file}: {e}")
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(copy_one, *job) for job in jobs]
+                try:
+                    for future in as_completed(futures):
+                        future.result()
+                except BaseException:
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    raise
+    finally:
+        if pbar is not None:
+            pbar.close()
+
+
   def remove_empty_folders(self):
-    """Recursively remove empty folders from the specified path."""
+    """
+    Recursively remove empty folders from the specified path.
+
+    Each folder is read once with os.scandir: a folder is empty when it holds
+    no files and all of its subfolders were removed, so no second listing is
+    needed to check it.
+    """
     # Check if the path is a directory
     if not os.path.isdir(self.dst_file):
         logging.info(f"The path '{self.dst_file}' is not a directory or does not exist.")
         return
 
-    # Walk through the directory
-    for root, dirs, files in os.walk(self.dst_file, topdown=False):
-        # Check each directory
-        for dir_name in dirs:
-            dir_path = os.path.join(root, dir_name)
-            # If the directory is empty, remove it
-            if not os.listdir(dir_path):
-                try:
-                    os.rmdir(dir_path)
-                    logging.info(f"Removed empty folder: {dir_path}")
-                except Exception as e:
-                    logging.info(f"Error removing {dir_path}: {e}")  
+    def prune(path):
+        # Scan the folder once, keeping its subfolders and noting any other entry
+        subdirs = []
+        empty = True
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    else:
+                        empty = False
+        except OSError as e:
+            logging.info(f"Error reading {path}: {e}")
+            return False
+
+        # Prune the subfolders first, so the folder is empty if they all went
+        for dir_path in subdirs:
+            if not prune(dir_path):
+                empty = False
+                continue
+            try:
+                os.rmdir(dir_path)
+                self._created_dirs.discard(dir_path)
+                logging.info(f"Removed empty folder: {dir_path}")
+            except Exception as e:
+                logging.info(f"Error removing {dir_path}: {e}")  
+                empty = False
+        return empty
 
+    # Walk the tree bottom-up; the root itself is kept
+    prune(self.dst_file)
+
+
+  def files_not_in_source(self, src_list, dst_list):
+      """
+      Returns the destination files with no counterpart in the source.
+
+      Parameters:
+      src_list (iterable): The source files, as paths or os.DirEntry objects.
+      dst_list (iterable): The destination files, likewise.
+
+      Returns:
+      list: The paths remove_files_not_in_source would delete.
+      """
+      # Every listed path starts with its root, so slice it off directly
+      src_root_len = len(self.src_file)
+      dst_root_len = len(self.dst_file)
+      # A set makes each membership test O(1) instead of a scan of the source list
+      src_compare_set = {f"/{os.fspath(file)[src_root_len:].lstrip('/')}" for file in src_list}
+      dst_compare = (f"/{os.fspath(file)[dst_root_len:].lstrip('/')}" for file in dst_list)
+
+      return [f"{self.dst_file}{element}" for element in dst_compare if element not in src_compare_set]
 
   def remove_files_not_in_source(self, 
                                  src_list, 
                                  dst_list):
-      src_compare_list = []
-      dst_compare_list = []
       logging.info(f"Starting deleting files not in source...")
-      for file in src_list:
-        src_compare_list.append(src2dst(file, self.src_file, "" ))
-      
-      for file in dst_list:
-        dst_compare_list.append(src2dst(file, self.dst_file, "" ))
-      
-      result = [f"{self.dst_file}{element}" for element in dst_compare_list if element not in src_compare_list]
-      logging.debug(f"Files to delete: {result}")
+      result = self.files_not_in_source(src_list, dst_list)
+      logging.debug("Files to delete: %s", result)
       
       for file in result:
         try:
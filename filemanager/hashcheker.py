@@ -1,23 +1,73 @@
+import os
+import mmap
 import hashlib
 import logging
+from concurrent.futures import ThreadPoolExecutor
+
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+
+# Hash types that need a package outside the standard library
+OPTIONAL_HASH_PACKAGES = {'xxh3': 'xxhash', 'blake3': 'blake3'}
+
+# Size of the reads fed to hashlib when a file cannot be mapped
+HASH_CHUNK = 4 * 1024 * 1024
+
+# Size of the blocks compared at a time by file2file
+COMPARE_BLOCK = 1 << 20
+
+# Size of the windows compared at a time by file2file when NumPy is available
+COMPARE_WINDOW = 64 << 20
+
 
 class HashChecker:
+  @staticmethod
+  def is_available(hash_type):
+      """
+      Tells whether the package a hash type needs is installed.
+
+      :param hash_type: The type of hash ('md5', 'sha256', 'xxh3' or 'blake3').
+      :return: True if HashChecker can be used with hash_type.
+      """
+      if hash_type == 'xxh3':
+          return xxhash is not None
+      if hash_type == 'blake3':
+          return blake3 is not None
+      return True
+
   def __init__(self, hash_type, file_path_a, file_path_b=None, hash_string=None):
       """
       Initializes the HashChecker with the specified hash type and file paths.
 
-      :param hash_type: The type of hash to use ('md5' or 'sha256').
+      :param hash_type: The type of hash to use ('md5', 'sha256', 'xxh3' or 'blake3').
+                        xxh3 and blake3 are much faster, but need the xxhash and blake3 packages.
       :param file_path_a: Path to the first file.
-      :param file_path_b: Path to the second file (optional, used in hashtohash).
+      :param file_path_b: Path to the second file (optional, used in file2file and hashtohash).
       :param hash_string: Hash string to compare against (optional, used in filetohash).
-      :raises ValueError: If the hash_type is not one of the allowed values.
+      :raises ValueError: If the hash_type is not one of the allowed values, or its package is missing.
       """
       # Define the allowed hash types
-      allowed_hash_types = ['md5', 'sha256']
+      allowed_hash_types = ['md5', 'sha256', 'xxh3', 'blake3']
 
       # Check if the provided hash_type is valid
       if hash_type not in allowed_hash_types:
           raise ValueError(f"Invalid hash_type. Allowed values are: {allowed_hash_types}")
+      if not self.is_available(hash_type):
+          raise ValueError(f"hash_type {hash_type} needs the {OPTIONAL_HASH_PACKAGES[hash_type]} package")
 
       # Initialize instance variables
       self.hash_type = hash_type
@@ -25,6 +75,97 @@ class HashChecker:
       self.file_path_b = file_path_b
       self.hash_string = hash_string
 
+  def _new_hash(self):
+      """
+      Returns a new hash object of the configured type.
+
+      The digest only detects changed files, so hashlib objects are created
+      with usedforsecurity=False, which lets OpenSSL skip its FIPS checks.
+      BLAKE3 may use several threads on large inputs.
+      """
+      if self.hash_type == 'xxh3':
+          return xxhash.xxh3_64()
+      if self.hash_type == 'blake3':
+          return blake3.blake3(max_threads=blake3.blake3.AUTO)
+      return hashlib.new(self.hash_type, usedforsecurity=False)
+
+  def _digest(self, file):
+      """
+      Computes the hex digest of an open binary file.
+
+      Regular files are mapped and hashed with a single update() call, so
+      hashlib runs one C-level pass over the whole file with the GIL released.
+      Files that cannot be mapped (empty files, pipes) are read with os.readv
+      straight from the descriptor into one reused buffer, so no chunk is
+      allocated per read and each update() hashes 4 MiB with the GIL released.
+
+      :param file: A file object opened in binary read mode.
+      :return: The hex digest of the file's content.
+      """
+      if os.fstat(file.fileno()).st_size:
+          try:
+              with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+                  hash = self._new_hash()
+                  hash.update(mapping)
+                  return hash.hexdigest()
+          except (OSError, ValueError, OverflowError) as e:
+              logging.debug("Cannot map %s, reading it instead: %s", file.name, e)
+
+      hash = self._new_hash()
+      buffer = bytearray(HASH_CHUNK)
+      view = memoryview(buffer)
+      fd = file.fileno()
+      while size := os.readv(fd, [buffer]):
+          hash.update(view[:size])
+      return hash.hexdigest()
+
+  def _hash_file(self, file_path):
+      """
+      Computes the hex digest of a file.
+
+      :param file_path: Path to the file to hash.
+      :return: The hex digest of the file's content.
+      :raises FileNotFoundError: If the file is not found.
+      """
+      # BLAKE3 maps and hashes the file itself, across several threads
+      if self.hash_type == 'blake3':
+          hash = self._new_hash()
+          hash.update_mmap(file_path)
+          return hash.hexdigest()
+
+      with open(file_path, "rb") as file:
+          return self._digest(file)
+
+  def _mappings_equal(self, mapping_a, mapping_b, size):
+      """
+      Compares two memory-mapped files of the same size.
+
+      With NumPy installed, each 64 MiB window is viewed in place and compared
+      in a single C call; without it, 1 MiB blocks are read and compared as
+      bytes. Either way the comparison stops at the first differing window.
+
+      :param mapping_a: The mapping of the first file.
+      :param mapping_b: The mapping of the second file.
+      :param size: The size of both files.
+      :return: True if both mappings hold the same bytes, False otherwise.
+      """
+      if numpy is None:
+          while block := mapping_a.read(COMPARE_BLOCK):
+              if block != mapping_b.read(COMPARE_BLOCK):
+                  return False
+          return True
+
+      for offset in range(0, size, COMPARE_WINDOW):
+          count = min(COMPARE_WINDOW, size - offset)
+          window_a = numpy.frombuffer(mapping_a, dtype=numpy.uint8, count=count, offset=offset)
+          window_b = numpy.frombuffer(mapping_b, dtype=numpy.uint8, count=count, offset=offset)
+          equal = numpy.array_equal(window_a, window_b)
+          # The views must be gone before the mappings can be closed
+          del window_a, window_b
+          if not equal:
+              return False
+      return True
+
   def filetohash(self):
       """
       Verifies if the hash of the file matches the provided hash string.
@@ -33,24 +174,12 @@ class HashChecker:
       :raises FileNotFoundError: If the file at file_path_a is not found.
       :raises Exception: For any other errors that occur during file reading or hashing.
       """
-      # Select the hash function based on hash_type
-      if self.hash_type == 'md5':
-          hash = hashlib.md5()
-      elif self.hash_type == 'sha256':
-          hash = hashlib.sha256()
-
       try:
-          # Open the file in binary read mode
-          with open(self.file_path_a, "rb") as file:
-              # Read the file in chunks to avoid memory issues with large files
-              while chunk := file.read(8192):
-                  hash.update(chunk)
-
           # Compute the hash of the file
-          file_hash = hash.hexdigest()
+          file_hash = self._hash_file(self.file_path_a)
 
           # Compare the computed hash with the provided hash string
-          logging.debug(f"Computed hash: {file_hash}")
+          logging.debug("Computed hash: %s", file_hash)
           return file_hash == self.hash_string
       except FileNotFoundError:
           # Handle the case where the file is not found
@@ -63,39 +192,48 @@ class HashChecker:
 
   def file2file(self):
       """
-      Compares the hash of two files.
+      Compares the content of two files.
 
-      :return: True if the hashes of the two files match, False otherwise.
+      Files of different sizes are reported as different without reading
+      them. Otherwise both files are mapped and compared block by block,
+      stopping at the first mismatch, so nothing is hashed.
+
+      :return: True if the two files have the same content, False otherwise.
       :raises FileNotFoundError: If either file at file_path_a or file_path_b is not found.
-      :raises Exception: For any other errors that occur during file reading or hashing.
+      :raises Exception: For any other errors that occur during file reading.
       """
       # Check if the second file path is provided
       if not self.file_path_b:
           logging.error("Second file path is not provided.")
           return False
 
-      # Select the hash function based on hash_type
-      if self.hash_type == 'md5':
-          hash_a = hashlib.md5()
-          hash_b = hashlib.md5()
-      elif self.hash_type == 'sha256':
-          hash_a = hashlib.sha256()
-          hash_b = hashlib.sha256()
-
       try:
-          # Compute hash for the first file
-          with open(self.file_path_a, "rb") as file_a:
-              while chunk := file_a.read(8192):
-                  hash_a.update(chunk)
+          with open(self.file_path_a, "rb") as file_a, open(self.file_path_b, "rb") as file_b:
+              stat_a = os.fstat(file_a.fileno())
+              stat_b = os.fstat(file_b.fileno())
+              # Both paths lead to the same file, there is nothing to read
+              if os.path.samestat(stat_a, stat_b):
+                  logging.debug("Same file: %s and %s", self.file_path_a, self.file_path_b)
+                  return True
+
+              # Files of different sizes cannot be equal
+              size = stat_a.st_size
+              if size != stat_b.st_size:
+                  logging.debug("Sizes differ: %s and %s", self.file_path_a, self.file_path_b)
+                  return False
+              # Empty files cannot be mapped, and are equal anyway
+              if not size:
+                  return True
 
-          # Compute hash for the second file
-          with open(self.file_path_b, "rb") as file_b:
-              while chunk := file_b.read(8192):
-                  hash_b.update(chunk)
+              with mmap.mmap(file_a.fileno(), 0, access=mmap.ACCESS_READ) as mapping_a, \
+                   mmap.mmap(file_b.fileno(), 0, access=mmap.ACCESS_READ) as mapping_b:
+                  equal = self._mappings_equal(mapping_a, mapping_b, size)
 
-          # Compare the two computed hashes
-          logging.debug(f"Computed hash: {self.file_path_a} and {self.file_path_b}")
-          return hash_a.hexdigest() == hash_b.hexdigest()
+          if equal:
+              logging.debug("Contents match: %s and %s", self.file_path_a, self.file_path_b)
+          else:
+              logging.debug("Contents differ: %s and %s", self.file_path_a, self.file_path_b)
+          return equal
 
       except FileNotFoundError as e:
           # Handle the case where one of the files is not found
@@ -104,4 +242,46 @@ class HashChecker:
       except Exception as e:
           # Handle any other exceptions that may occur
           logging.error(f"An error occurred: {e}")
-          return False
\ No newline at end of file
+          return False
+
+  def hashtohash(self):
+      """
+      Compares the hash of two files.
+
+      :return: True if the hashes of the two files match, False otherwise.
+      :raises FileNotFoundError: If either file at file_path_a or file_path_b is not found.
+      :raises Exception: For any other errors that occur during file reading or hashing.
+      """
+      # Check if the second file path is provided
+      if not self.file_path_b:
+          logging.error("Second file path is not provided.")
+          return False
+
+      # Both paths lead to the same file, there is nothing to hash
+      try:
+          if os.path.samefile(self.file_path_a, self.file_path_b):
+              return True
+      except OSError:
+          pass  # Reported below, when the files are opened
+
+      # Hash both files at the same time; hashlib releases the GIL while hashing
+      with ThreadPoolExecutor(max_workers=2) as executor:
+          futures = [executor.submit(self._hash_file, self.file_path_a),
+                     executor.submit(self._hash_file, self.file_path_b)]
+
+      digests = []
+      for future in futures:
+          try:
+              digests.append(future.result())
+          except FileNotFoundError as e:
+              # Handle the case where one of the files is not found
+              logging.error(f"File not found: {e.filename}")
+              return False
+          except Exception as e:
+              # Handle any other exceptions that may occur
+              logging.error(f"An error occurred: {e}")
+              return False
+
+      # Compare the two computed hashes
+      logging.debug("Computed hash: %s and %s", self.file_path_a, self.file_path_b)
+      return digests[0] == digests[1]
@@ -0,0 +1,339 @@
+import os
+import re
+import sys
+import stat
+import errno
+import fcntl
+import shutil
+import logging
+import platform
+import threading
+from itertools import islice
+
+try:
+    import liburing
+except ImportError:
+    liburing = None
+
+
+# Number of files kept in flight on one ring
+IN_FLIGHT = 64
+
+# Size requested for the pipe each file is spliced through
+PIPE_SIZE = 1024 * 1024
+
+# IORING_OP_SPLICE appeared in 5.7, after OPENAT and CLOSE in 5.6
+MIN_KERNEL = (5, 7)
+
+# AT_FDCWD on Linux, in case the bindings do not export it
+AT_FDCWD = getattr(liburing, "AT_FDCWD", -100)
+
+# Files spliced in more than one go get readahead and page cache hints
+ADVISE_MIN_SIZE = PIPE_SIZE
+
+# States of a file moving through the ring
+OPENING_SRC, OPENING_DST, SPLICE_IN, SPLICE_OUT, CLOSING = range(5)
+
+# One ring per thread, reused by every copy made from that thread
+_local = threading.local()
+
+
+def kernel_version():
+  """
+  Returns the running kernel version as a (major, minor) tuple.
+  """
+  match = re.match(r"(\d+)\.(\d+)", platform.release())
+  if match is None:
+      return (0, 0)
+  return (int(match.group(1)), int(match.group(2)))
+
+
+def available():
+  """
+  Returns True if the liburing bindings are installed and the kernel
+  supports every io_uring operation the copier needs.
+  """
+  return (liburing is not None
+          and getattr(liburing, "ffi", None) is not None
+          and sys.platform.startswith("linux")
+          and kernel_version() >= MIN_KERNEL)
+
+
+def advise(fd, advice):
+  """
+  Gives the kernel an access pattern hint for the whole of fd.
+  """
+  try:
+      os.posix_fadvise(fd, 0, 0, advice)
+  except OSError as e:
+      logging.debug("posix_fadvise failed: %s", e)
+
+
+class Transfer:
+  """
+  A single file copy driven by io_uring completions.
+  """
+
+  __slots__ = ("src_file", "dst_file", "state", "path", "src_fd", "dst_fd",
+               "pipe_r", "pipe_w", "offset", "buffered", "advise", "size")
+
+  def __init__(self, src_file, dst_file):
+      self.src_file = src_file
+      self.dst_file = dst_file
+      self.state = OPENING_SRC
+      # Keeps the C string alive until the kernel has read it
+      self.path = None
+      self.src_fd = None
+      self.dst_fd = None
+      self.pipe_r = None
+      self.pipe_w = None
+      self.offset = 0
+      self.buffered = 0
+      # Whether the file is large enough for page cache hints
+      self.advise = False
+      self.size = 0
+
+  def release(self):
+      """
+      Closes every descriptor still held by the transfer.
+      """
+      for name in ("src_fd", "dst_fd", "pipe_r", "pipe_w"):
+          fd = getattr(self, name)
+          if fd is not None:
+              try:
+                  os.close(fd)
+              except OSError:
+                  pass
+              setattr(self, name, None)
+
+
+class IOUringCopier:
+  """
+  Copies files through one io_uring, keeping many of them in flight.
+
+  Each file is a small state machine, OPENING_SRC -> OPENING_DST ->
+  SPLICE_IN <-> SPLICE_OUT -> CLOSING, advanced whenever one of its
+  completions arrives, so the open/read/write/close sequences of different
+  files overlap instead of running one after another. Data moves with
+  splice() through a per-file pipe and never enters user space.
+  """
+
+  def __init__(self, in_flight=IN_FLIGHT):
+      """
+      Initializes the ring.
+
+      :param in_flight: The maximum number of files copied at the same time.
+      """
+      self.in_flight = in_flight
+      # Tokens are never reused on a ring, even across copy_many calls
+      self.next_token = 1
+      self.ring = liburing.io_uring()
+      self.cqes = liburing.io_uring_cqes()
+      liburing.io_uring_queue_init(in_flight * 2, self.ring, 0)
+
+  def close(self):
+      """
+      Tears the ring down.
+      """
+      if self.ring is not None:
+          liburing.io_uring_queue_exit(self.ring)
+          self.ring = None
+
+  def _prepare(self, token, transfer):
+      """
+      Queues the next operation of a transfer, according to its state.
+      """
+      sqe = liburing.io_uring_get_sqe(self.ring)
+      if transfer.state == OPENING_SRC:
+          transfer.path = liburing.ffi.new("char[]", os.fsencode(transfer.src_file))
+          # O_NONBLOCK keeps a named pipe from blocking the open; it
+          # changes nothing for the regular files splice reads from
+          liburing.io_uring_prep_openat(sqe, AT_FDCWD, transfer.path,
+                                        os.O_RDONLY | os.O_CLOEXEC | os.O_NONBLOCK, 0)
+      elif transfer.state == OPENING_DST:
+          transfer.path = liburing.ffi.new("char[]", os.fsencode(transfer.dst_file))
+          liburing.io_uring_prep_openat(sqe, AT_FDCWD, transfer.path,
+                                        os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_CLOEXEC,
+                                        0o666)
+      elif transfer.state == SPLICE_IN:
+          liburing.io_uring_prep_splice(sqe, transfer.src_fd, transfer.offset,
+                                        transfer.pipe_w, -1, PIPE_SIZE, 0)
+      elif transfer.state == SPLICE_OUT:
+          liburing.io_uring_prep_splice(sqe, transfer.pipe_r, -1,
+                                        transfer.dst_fd, transfer.offset,
+                                        transfer.buffered, 0)
+      else:
+          liburing.io_uring_prep_close(sqe, transfer.dst_fd)
+      sqe.user_data = token
+
+  def _advance(self, transfer, result, progress):
+      """
+      Moves a transfer to its next state after one of its operations completed.
+
+      :return: True once the transfer is finished.
+      :raises OSError: If the completed operation failed.
+      """
+      if result < 0:
+          raise OSError(-result, os.strerror(-result))
+
+      if transfer.state == OPENING_SRC:
+          transfer.src_fd = result
+          transfer.path = None
+          src_stat = os.fstat(transfer.src_fd)
+          # Special files are refused before the destination is created
+          if not stat.S_ISREG(src_stat.st_mode):
+              raise OSError(errno.EINVAL, "not a regular file")
+          transfer.size = src_stat.st_size
+          transfer.state = OPENING_DST
+      elif transfer.state == OPENING_DST:
+          transfer.dst_fd = result
+          transfer.path = None
+          transfer.pipe_r, transfer.pipe_w = os.pipe2(os.O_CLOEXEC)
+          try:
+              fcntl.fcntl(transfer.pipe_w, fcntl.F_SETPIPE_SZ, PIPE_SIZE)
+          except OSError:
+              pass  # Keep the default pipe size
+          size = transfer.size
+          if size >= ADVISE_MIN_SIZE:
+              transfer.advise = True
+              advise(transfer.src_fd, os.POSIX_FADV_SEQUENTIAL)
+          # Empty files have nothing to splice
+          if size:
+              transfer.state = SPLICE_IN
+          else:
+              transfer.state = CLOSING
+      elif transfer.state == SPLICE_IN:
+          if result == 0:
+              # Neither file is read again by a one-shot sync
+              if transfer.advise:
+                  advise(transfer.src_fd, os.POSIX_FADV_DONTNEED)
+                  advise(transfer.dst_fd, os.POSIX_FADV_DONTNEED)
+              transfer.state = CLOSING
+          else:
+              transfer.buffered = result
+              transfer.state = SPLICE_OUT
+      elif transfer.state == SPLICE_OUT:
+          if result == 0:
+              raise OSError(errno.EIO, "splice to destination made no progress")
+          transfer.offset += result
+          transfer.buffered -= result
+          if progress is not None:
+              progress(result)
+          if not transfer.buffered:
+              transfer.state = SPLICE_IN
+      else:
+          # The ring closed the destination for us
+          transfer.dst_fd = None
+          transfer.release()
+          return True
+      return False
+
+  def copy_many(self, pairs, progress=None):
+      """
+      Copies the data of every (src, dst) pair through the ring.
+
+      :param pairs: (source path, destination path) tuples.
+      :param progress: Called with the number of bytes written after each splice.
+      :return: A tuple (copied, failed) of lists of pairs.
+      """
+      pending = iter(pairs)
+      active = {}
+      copied = []
+      failed = []
+      try:
+          while True:
+              # Top the ring up with new files
+              for src_file, dst_file in islice(pending, self.in_flight - len(active)):
+                  token = self.next_token
+                  self.next_token += 1
+                  active[token] = Transfer(src_file, dst_file)
+                  self._prepare(token, active[token])
+              if not active:
+                  break
+
+              liburing.io_uring_submit(self.ring)
+              liburing.io_uring_wait_cqe(self.ring, self.cqes)
+              cqe = self.cqes[0]
+              token, result = cqe.user_data, cqe.res
+              liburing.io_uring_cqe_seen(self.ring, cqe)
+
+              transfer = active.get(token)
+              if transfer is None:
+                  # Left over from a transfer that is no longer tracked
+                  logging.debug("Ignoring io_uring completion for token %s", token)
+                  continue
+              try:
+                  if self._advance(transfer, result, progress):
+                      del active[token]
+                      copied.append((transfer.src_file, transfer.dst_file))
+                  else:
+                      self._prepare(token, transfer)
+              except OSError as e:
+                  logging.debug("io_uring copy of %s failed: %s", transfer.src_file, e)
+                  transfer.release()
+                  # The file is copied again from scratch by the fallback
+                  if progress is not None and transfer.offset:
+                      progress(-transfer.offset)
+                  del active[token]
+                  failed.append((transfer.src_file, transfer.dst_file))
+      except BaseException:
+          # The operations still in flight would complete on the next call:
+          # tear the ring down rather than reuse it
+          self.close()
+          raise
+      finally:
+          for transfer in active.values():
+              transfer.release()
+      return copied, failed
+
+
+def get_copier(in_flight=IN_FLIGHT):
+  """
+  Returns the calling thread's IOUringCopier, creating it on first use.
+
+  Setting a ring up costs a few syscalls and locked memory, so it is kept
+  for the life of the thread instead of being rebuilt for every copy.
+  """
+  copier = getattr(_local, "copier", None)
+  # A ring torn down after an error is replaced with a fresh one
+  if copier is None or copier.ring is None:
+      copier = _local.copier = IOUringCopier(in_flight)
+  return copier
+
+
+def copy_many(pairs, in_flight=IN_FLIGHT, progress=None):
+  """
+  Copies files and their metadata like shutil.copy2, through io_uring when available.
+
+  Files the ring could not copy, or all of them when io_uring is not
+  available, go through shutil.copy2 instead.
+
+  :param pairs: (source path, destination path) tuples.
+  :param in_flight: The maximum number of files copied at the same time, for a new ring.
+  :param progress: Called with the number of bytes copied.
+  :return: The list of pairs copied successfully.
+  """
+  pairs = list(pairs)
+  copied = []
+  failed = pairs
+  if available():
+      copied, failed = get_copier(in_flight).copy_many(pairs, progress)
+      for src_file, dst_file in list(copied):
+          try:
+              shutil.copystat(src_file, dst_file)
+          except OSError as e:
+              logging.error(f"Error copying metadata of {src_file}: {e}")
+              copied.remove((src_file, dst_file))
+
+  for src_file, dst_file in failed:
+      try:
+          shutil.copy2(src_file, dst_file)
+          copied.append((src_file, dst_file))
+          if progress is not None:
+              progress(os.path.getsize(dst_file))
+      except Exception as e:
+          # Out of space or quota: no later copy can succeed either
+          if isinstance(e, OSError) and e.errno in (errno.ENOSPC, errno.EDQUOT):
+              raise
+          logging.error(f"Error copying file: {e}")
+  return copied
@@ -0,0 +1,180 @@
+import os
+import json
+import time
+import hashlib
+import logging
+
+
+# Bumped whenever the layout of the manifest file changes
+MANIFEST_VERSION = 1
+
+# Directories modified this close to the walk are not cached: another change
+# within the same timestamp tick would leave their mtime as it was
+RACY_WINDOW_NS = 2 * 1000 * 1000 * 1000
+
+
+def cache_dir():
+  """
+  Returns the folder manifests are kept in, ~/.cache/pysync by default.
+  """
+  base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+  return os.path.join(base, "pysync")
+
+
+class CachedEntry:
+  """
+  A file listed from the manifest, standing in for the os.DirEntry a scan would give.
+
+  Only the name and inode come from the manifest, since they cannot change
+  without changing the mtime of the folder. The size and times can, so
+  stat() asks the filesystem on first use and caches the result, as
+  DirEntry.stat() does.
+  """
+
+  __slots__ = ("name", "path", "_inode", "_symlink", "_stat")
+
+  def __init__(self, directory, name, inode, symlink):
+      self.name = name
+      self.path = os.path.join(directory, name)
+      self._inode = inode
+      self._symlink = symlink
+      self._stat = None
+
+  def __fspath__(self):
+      return self.path
+
+  def __repr__(self):
+      return f"<CachedEntry {self.name!r}>"
+
+  def inode(self):
+      return self._inode
+
+  def is_symlink(self):
+      return self._symlink
+
+  def is_dir(self, follow_symlinks=True):
+      # A symlink may now point to a folder without its parent changing
+      if self._symlink and follow_symlinks:
+          return os.path.isdir(self.path)
+      return False
+
+  def is_file(self, follow_symlinks=True):
+      if self._symlink:
+          return follow_symlinks and os.path.isfile(self.path)
+      return True
+
+  def stat(self, follow_symlinks=True):
+      if not follow_symlinks:
+          return os.lstat(self.path)
+      if self._stat is None:
+          self._stat = os.stat(self.path)
+      return self._stat
+
+
+class Manifest:
+  """
+  The folder listings of one tree, kept on disk between runs.
+
+  Each folder is stored under its path relative to the root with the mtime
+  it had when it was read, the names of its subfolders and the name, inode
+  and symlink flag of each file. Adding, removing or renaming an entry
+  changes the mtime of its folder, so a folder whose mtime is unchanged
+  can be listed from the manifest without reading it again. Folders are
+  checked one by one, since a change deep in the tree does not touch the
+  mtime of the folders above it.
+  """
+
+  def __init__(self, root, full_scan=False, read_only=False):
+      """
+      Loads the manifest of root, if there is one.
+
+      :param root: The root folder of the tree.
+      :param full_scan: If True, the stored listings are ignored and replaced.
+      :param read_only: If True, the stored listings are used but never written back.
+      """
+      self.root = root
+      self.read_only = read_only
+      self.path = os.path.join(cache_dir(),
+                               hashlib.sha1(os.fsencode(os.path.abspath(root))).hexdigest() + ".manifest")
+      self.started_ns = time.time_ns()
+      self.folders = {}
+      self.updated = {}
+      if not full_scan:
+          self.load()
+
+  def load(self):
+      """
+      Reads the stored listings, leaving them empty if the file is missing or unreadable.
+      """
+      try:
+          with open(self.path, encoding="utf-8") as f:
+              data = json.load(f)
+      except FileNotFoundError:
+          return
+      except (OSError, ValueError) as e:
+          logging.debug("Ignoring manifest %s: %s", self.path, e)
+          return
+      if not isinstance(data, dict) or data.get("version") != MANIFEST_VERSION:
+          return
+      folders = data.get("folders")
+      if isinstance(folders, dict):
+          self.folders = folders
+
+  def key(self, folder):
+      return folder[len(self.root):]
+
+  def lookup(self, folder, mtime_ns):
+      """
+      Returns the stored (subfolders, files) of folder if its mtime is unchanged, else None.
+
+      Subfolders are full paths; files are CachedEntry objects. A listing
+      the manifest holds in the wrong shape, e.g. after a hand edit, is
+      treated as missing, so the folder is read again.
+      """
+      key = self.key(folder)
+      listing = self.folders.get(key)
+      try:
+          if listing is None or listing[0] != mtime_ns:
+              return None
+          subdirs = [os.path.join(folder, name) for name in listing[1]]
+          files = [CachedEntry(folder, name, inode, symlink) for name, inode, symlink in listing[2]]
+      except (TypeError, ValueError, IndexError, KeyError) as e:
+          logging.debug("Ignoring the cached listing of %s: %s", folder, e)
+          return None
+      # Still valid: carry it over to the manifest written at the end
+      self.updated[key] = listing
+      return subdirs, files
+
+  def record(self, folder, mtime_ns, subdirs, files):
+      """
+      Stores the listing of a folder just read, unless it was modified too recently to trust.
+
+      :param subdirs: Full paths of the subfolders.
+      :param files: os.DirEntry objects of the files.
+      """
+      if mtime_ns >= self.started_ns - RACY_WINDOW_NS:
+          return
+      # Walker threads record different folders; a dict store is atomic
+      self.updated[self.key(folder)] = [mtime_ns,
+                                        [os.path.basename(path) for path in subdirs],
+                                        [[entry.name, entry.inode(), entry.is_symlink()] for entry in files]]
+
+  def save(self):
+      """
+      Replaces the stored listings with the folders seen in this walk.
+      """
+      if self.read_only:
+          return
+      tmp_path = f"{self.path}.{os.getpid()}.tmp"
+      try:
+          os.makedirs(os.path.dirname(self.path), exist_ok=True)
+          with open(tmp_path, "w", encoding="utf-8") as f:
+              json.dump({"version": MANIFEST_VERSION, "root": os.path.abspath(self.root),
+                         "folders": self.updated}, f, separators=(",", ":"))
+          os.replace(tmp_path, self.path)
+      except OSError as e:
+          logging.warning(f"Could not save the manifest {self.path}: {e}")
+          try:
+              os.remove(tmp_path)
+          except OSError:
+              pass
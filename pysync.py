@@ -1,15 +1,22 @@
 #!/usr/bin/python3
 
 import os
+import stat
 import argparse
 import sys
 import time
 import logging
-import filecmp
-from concurrent.futures import ThreadPoolExecutor
+import multiprocessing
+from dataclasses import dataclass
+from functools import partial
+from itertools import islice, repeat
+from operator import attrgetter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, as_completed, wait
 from filemanager.logger import Logger
-from filemanager.filemanager import FileManager, get_uid_gid, list_files_recursively, src2dst, ch_own
-# from filemanager.hashcheker import HashChecker
+from filemanager import iouring_backend
+from filemanager.filemanager import FileManager, get_uid_gid, list_files_recursively, iter_files_recursively
+from filemanager.hashcheker import HashChecker
+from filemanager.manifest import Manifest
 
 
 '''
@@ -22,18 +29,82 @@ from filemanager.filemanager import FileManager, get_uid_gid, list_files_recursi
 
 VERSION = "0.0.14"
 
+# Average file sizes below/above which the copy pool grows/shrinks
+SMALL_FILE_SIZE = 1024 * 1024
+LARGE_FILE_SIZE = 64 * 1024 * 1024
+
+# Threads comparing source files with the destination while planning
+PLAN_WORKERS = min(32, 4 * (os.cpu_count() or 1))
+
+# Files queued on a pool per thread
+QUEUED_PER_WORKER = 4
+
+# Source files sorted together by inode before they are compared
+INODE_WINDOW = 4096
+
+# Threads driving a ring each with --io-backend iouring; every ring keeps
+# iouring_backend.IN_FLIGHT files, four descriptors apiece, open at once
+IOURING_THREADS = 2
+
+
+@dataclass(slots=True)
+class CopyPolicy:
+  """The FileManager settings shared by every file copied in one run."""
+  root_dir: str
+  preserve_permissions: bool = False
+  owner: int | None = None
+  group: int | None = None
+  status_bar: bool = False
+  io_backend: str = "threads"
+
+  def manager(self, src_file, dst_file, src_stat=None):
+      """Return a FileManager copying src_file to dst_file with these settings."""
+      return FileManager(src_file,
+                         dst_file,
+                         root_dir=self.root_dir,
+                         preserve_permissions=self.preserve_permissions,
+                         group=self.group,
+                         owner=self.owner,
+                         status_bar=self.status_bar,
+                         src_stat=src_stat)
+
+
+@dataclass(slots=True)
+class CopyOp:
+  """One file of the plan: to copy, or to copy if its digest differs."""
+  src: os.DirEntry
+  dst: str
+  size: int
+  needs_hash: bool = False
+
+
+def positive_int(value):
+  """Parse a command-line value as an integer of at least 1."""
+  try:
+      number = int(value)
+  except ValueError:
+      raise argparse.ArgumentTypeError(f"invalid int value: '{value}'")
+  if number < 1:
+      raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+  return number
+
 
 def parse_arguments():
   """Parse command-line arguments."""
   parser = argparse.ArgumentParser(description="Clone source folder to destination folder.")
   parser.add_argument("--src", required=True, help="Source Folder")
   parser.add_argument("--dst", required=True, help="Destination Folder")
-  parser.add_argument("--hash-chk", action='store_true', help="Check hash if file exists in destination")
+  parser.add_argument("--hash-chk", action='store_true', help="Check hash if file exists in destination with the same size but another modification time")
+  parser.add_argument("--hash-algo", default="xxh3", choices=["xxh3", "blake3", "md5"], help="Hash used by --hash-chk (default: xxh3, md5 if xxhash is not installed)")
   parser.add_argument("--delete", action='store_true', help="Remove files not in source before sync")
   parser.add_argument("--delete-after", action='store_true', help="Remove files not in source after sync")
   parser.add_argument("--chown", required=False, help="Username/groupname mapping (USER:GROUP)")
   parser.add_argument("--progress", action='store_true', help="Show progress during transfer")
   parser.add_argument("--attribute", action='store_true', help="Copy files and attributes")
+  parser.add_argument("--io-backend", default="auto", choices=["auto", "threads", "iouring", "processes"], help="How file data is copied (default: auto, io_uring when the files are small and it is available, else threads)")
+  parser.add_argument("--jobs", type=positive_int, default=None, help="Number of files copied in parallel (default: based on file sizes)")
+  parser.add_argument("--dry-run", action='store_true', help="Show what would be copied without changing anything")
+  parser.add_argument("--full-scan", action='store_true', help="Read every folder again instead of reusing the listings cached by earlier runs")
   parser.add_argument("--verbose", action='store_true', help="Verbose mode")
   parser.add_argument("--version", action='version', version=f"%(prog)s {VERSION}")
 
@@ -45,61 +116,426 @@ def parse_arguments():
   return parser.parse_args()
 
 def validate_folders(src, dst):
-  """Validate the existence of source and destination folders."""
-  if not os.path.exists(src):
-      logging.error(f"Error: Source folder '{src}' does not exist.")
-      sys.exit(1)
-  if not os.path.exists(dst):
-      logging.error(f"Error: Destination folder '{dst}' does not exist.")
+  """Validate the existence of source and destination folders, with one stat() each."""
+  for name, folder in (("Source", src), ("Destination", dst)):
+      try:
+          folder_stat = os.stat(folder)
+      except FileNotFoundError:
+          logging.error(f"Error: {name} folder '{folder}' does not exist.")
+          sys.exit(1)
+      except OSError as e:
+          logging.error(f"Error: Cannot access {name.lower()} folder '{folder}': {e}")
+          sys.exit(1)
+      if not stat.S_ISDIR(folder_stat.st_mode):
+          logging.error(f"Error: {name} folder '{folder}' is not a directory.")
+          sys.exit(1)
+
+
+def resolve_owner(chown):
+  """Resolve a USER:GROUP mapping to (uid, gid), or (None, None) without one."""
+  if not chown:
+      return None, None
+  ids = get_uid_gid(chown)
+  if isinstance(ids, str):
+      logging.error(f"Cannot resolve '{chown}'. {ids}")
       sys.exit(1)
+  return ids
 
 
-def process_file(file, args):
-  dst_file = src2dst(file, args.src, args.dst)
-  
-  if os.path.exists(dst_file):
-    filecmp.cmp(file, dst_file, shallow=not args.hash_chk)
-    return
-    # if (args.hash_chk):
+def quick_check(src_entry, dst_file):
+  """
+  Tell whether an existing destination file differs from its source.
+
+  Like rsync's quick check, files with the same size and modification time
+  are taken as unchanged without reading them.
+
+  :return: True if the file must be copied, False if it is unchanged, or
+    None if the sizes match but the times differ, so only the contents can tell.
+  """
+  try:
+      src_stat = src_entry.stat()  # Cached on the DirEntry
+      dst_stat = os.stat(dst_file)
+  except OSError as e:
+      logging.debug("Cannot compare %s: %s", dst_file, e)
+      return True
+
+  if src_stat.st_size != dst_stat.st_size:
+      return True
+  if int(src_stat.st_mtime) == int(dst_stat.st_mtime):
+      return False
+  return None
+
+
+def hashes_differ(src_file, dst_file, hash_algo):
+  """
+  Tell whether two files have different digests.
+
+  Kept at module level so that it can be sent to a worker process.
+  """
+  return not HashChecker(hash_algo, src_file, dst_file).hashtohash()
+
+
+def plan_copy(src_entry, args, dst_set):
+  """
+  Decide what to do with one source file.
+
+  :return: A CopyOp, or None if the destination already holds the same file.
+  """
+  # The destination is the source path with its root swapped, one slice
+  dst_file = args.dst_root + src_entry.path[args.src_prefix_len:]
+  try:
+      size = src_entry.stat().st_size  # Cached on the DirEntry for the copy
+  except OSError as e:
+      logging.error(f"Error reading {src_entry.path}: {e}")
+      return None
+
+  # dst_set holds every file found in the destination, no stat() needed
+  if dst_file not in dst_set:
+      return CopyOp(src_entry, dst_file, size)
+  differs = quick_check(src_entry, dst_file)
+  if differs is None:
+      # Without --hash-chk a different mtime is enough to copy the file again
+      return CopyOp(src_entry, dst_file, size, needs_hash=args.hash_chk)
+  return CopyOp(src_entry, dst_file, size) if differs else None
+
+
+def plan_copies(src_entries, dst_set, args):
+  """
+  Find the source files to copy, before anything is copied.
+
+  The files are compared with the destination from a thread pool, in inode
+  order, while the source is still being walked. Only the files that need
+  work are kept, largest first: starting the longest copies early keeps
+  the last threads from finishing long after the others.
+
+  :return: A list of CopyOp, sorted by size in descending order.
+  """
+  task = partial(plan_copy, args=args, dst_set=dst_set)
+  with ThreadPoolExecutor(max_workers=PLAN_WORKERS) as executor:
+      plan = [op for op in run_bounded(executor, task, inode_order(src_entries),
+                                       PLAN_WORKERS * QUEUED_PER_WORKER)
+              if op is not None]
+  plan.sort(key=attrgetter("size"), reverse=True)
+  return plan
+
+
+def report_plan(plan):
+  """Log what a run would copy, for --dry-run."""
+  for op in plan:
+      if op.needs_hash:
+          logging.info(f"{op.src.path} => {op.dst} (if the contents differ)")
+      else:
+          logging.info(f"{op.src.path} => {op.dst}")
+  to_hash = sum(1 for op in plan if op.needs_hash)
+  logging.info(f"Dry run: {len(plan) - to_hash} files ({sum(op.size for op in plan if not op.needs_hash)} bytes) "
+               f"to copy, {to_hash} more to compare by hash first.")
+
+
+def run_copy(op, policy, hash_algo, hasher=None, copier=None):
+  """
+  Carry out one CopyOp, comparing digests first if it needs it.
+
+  Hashes are computed in the hasher process pool if given.
+  """
+  if op.needs_hash:
+      if hasher is not None:
+          differs = hasher.submit(hashes_differ, op.src.path, op.dst, hash_algo).result()
+      else:
+          differs = hashes_differ(op.src.path, op.dst, hash_algo)
+      if not differs:
+          return
+  copy_file_(op.src, op.dst, policy, copier)
+
+
+def copy_batch(ops, policy, hash_algo, hasher=None):
+  """
+  Carry out a batch of CopyOps through the calling thread's io_uring.
 
-    #   if HashChecker("md5", file, dst_file).file2file():
-    #     return
-    # elif filecmp.cmp(file, dst_file, shallow=False):
-    #   return
-    
-  copy_file_(file, dst_file, args)
+  The digests of the operations that need it are compared first, in the
+  hasher process pool if given. The remaining files then share one ring,
+  so their opens, splices and closes are all in flight together, and
+  FileManager only applies the attributes afterwards.
+  """
+  hashed = [op for op in ops if op.needs_hash]
+  if hashed:
+      inputs = ([op.src.path for op in hashed], [op.dst for op in hashed], repeat(hash_algo))
+      results = hasher.map(hashes_differ, *inputs) if hasher is not None else map(hashes_differ, *inputs)
+      unchanged = {op.dst for op, differs in zip(hashed, results) if not differs}
+      ops = [op for op in ops if op.dst not in unchanged]
 
+  managers = {}
+  for op in ops:
+      fm = policy.manager(op.src.path, op.dst, op.src.stat())
+      if fm.source_is_regular():
+          managers[op.dst] = fm
 
-def synchronize_files(args, src_files, dst_files = None):
-  """Synchronize files from source to destination."""
+  for src_file, dst_file in iouring_backend.copy_many((fm.src_file, fm.dst_file) for fm in managers.values()):
+      try:
+          managers[dst_file].apply_attributes()
+          logging.info(f"{src_file} => {dst_file}")
+      except Exception as e:
+          logging.error(f"Error applying attributes to {dst_file}: {e}")
+
+
+def in_batches(items, size):
+  """
+  Yield the items in lists of up to size, without collecting the iterable.
+  """
+  items = iter(items)
+  while True:
+      batch = list(islice(items, size))
+      if not batch:
+          return
+      yield batch
+
+
+def pick_workers(sizes):
+  """
+  Pick the number of copy threads from the average size of the files to copy.
+
+  Many small files are bound by per-file syscall latency and gain from high
+  concurrency; a few large files are bound by bandwidth, where more threads
+  only contend for the disk.
+  """
+  cpus = os.cpu_count() or 1
+  if not sizes:
+      return 1
+
+  average_size = sum(sizes) / len(sizes)
+
+  if average_size < SMALL_FILE_SIZE:
+      workers = min(32, 4 * cpus)
+  elif average_size > LARGE_FILE_SIZE:
+      workers = min(4, cpus)
+  else:
+      workers = min(32, cpus + 4)
+  logging.debug("Average file size %d bytes, using %d copy threads", average_size, workers)
+  return workers
+
+
+def inode_order(entries, window=INODE_WINDOW):
+  """
+  Yield the entries sorted by inode number, window entries at a time.
+
+  Inodes allocated near each other usually sit near each other on disk, so
+  stat() calls made in this order read neighbouring inode table blocks on
+  a cold cache. The inode comes free with each DirEntry on Linux, or from
+  the manifest, and the window keeps a streamed listing from being
+  collected as a whole.
+  """
+  entries = iter(entries)
+  while True:
+      batch = list(islice(entries, window))
+      if not batch:
+          return
+      batch.sort(key=lambda entry: entry.inode())
+      yield from batch
+
+
+def make_dst_dirs(plan, policy):
+  """
+  Yield the operations of a plan, creating each destination folder beforehand.
+
+  Folders are created here, one at a time, from the thread feeding the copy
+  pool, instead of by the copy threads racing on the same mkdir. Each
+  folder is looked at once, and FileManager.make_dirs remembers what it
+  created, so the copies themselves no longer call mkdir.
+
+  With --chown, each folder and its parents below the destination root are
+  handed to the new owner in the same pass, so the tree does not have to
+  be walked again once the copies are done.
+  """
+  chown = policy.owner is not None or policy.group is not None
+  seen = set()
+  owned = set()
+  for op in plan:
+      dst_dir = os.path.dirname(op.dst)
+      if dst_dir not in seen:
+          seen.add(dst_dir)
+          try:
+              FileManager.make_dirs(dst_dir)
+          except OSError as e:
+              logging.error(f"Error creating folder {dst_dir}: {e}")
+          else:
+              if chown:
+                  try:
+                      chown_parents(dst_dir, policy.root_dir, policy, owned)
+                  except OSError as e:
+                      logging.error(f"Failed to change user or group for {dst_dir}: {e}")
+      yield op
+
+
+def chown_parents(dst_dir, dst_root, policy, owned):
+  """
+  Change the owner and group of dst_dir and its parents up to dst_root.
+
+  The root itself is left alone. Folders in owned are
+  skipped, and the ones changed here are added to it.
+  """
+  uid = -1 if policy.owner is None else policy.owner
+  gid = -1 if policy.group is None else policy.group
+  while len(dst_dir) > len(dst_root) and dst_dir not in owned:
+      owned.add(dst_dir)
+      os.chown(dst_dir, uid, gid, follow_symlinks=False)
+      logging.debug("User ID %s, Group ID %s applied to: %s", uid, gid, dst_dir)
+      dst_dir = os.path.dirname(dst_dir)
+
+
+def run_bounded(executor, fn, items, limit):
+  """
+  Call fn on every item in the executor, with at most limit calls pending,
+  and yield the results.
+
+  Unlike executor.map, which submits everything up front, items are pulled
+  from the iterable only as earlier calls finish, so a streamed listing is
+  never held in memory as a whole. Results are yielded in the order the
+  calls complete, not the order they were submitted, so the first
+  exception raised by any of them is re-raised straight away, after the
+  calls still queued in the executor have been cancelled.
+  """
+  pending = set()
+  try:
+      for item in items:
+          pending.add(executor.submit(fn, item))
+          if len(pending) >= limit:
+              done, pending = wait(pending, return_when=FIRST_COMPLETED)
+              for future in done:
+                  yield future.result()
+      for future in as_completed(pending):
+          yield future.result()
+  except BaseException:
+      # Do not start the rest of a run that is going to be aborted
+      executor.shutdown(wait=False, cancel_futures=True)
+      raise
+
+
+def synchronize_files(args, policy, src_files, dst_files):
+  """
+  Synchronize files from source to destination.
+
+  The run is planned first: src_files may be a generator, and the source
+  files are compared with the destination while it is still walking the
+  source. Only the files that need a copy or a hash are kept, and they are
+  then copied largest first. src_files is only collected into a list for
+  --delete and --delete-after, which need every source path. With
+  --dry-run the plan is logged and nothing is changed.
+  """
   fm = FileManager(args.src, args.dst)
-  if args.delete:
+  dst_set = {entry.path for entry in dst_files}
+  if args.delete or args.delete_after:
+      src_files = list(src_files)
+  if args.delete and not args.dry_run:
       fm.remove_files_not_in_source(src_files, dst_files)
       fm.remove_empty_folders()
 
-    # Use ThreadPoolExecutor to manage a pool of threads
-  with ThreadPoolExecutor() as executor:
-      # Submit tasks to the executor for each file
-      futures = [executor.submit(process_file, file, args) for file in src_files]
-      # Optionally, wait for all futures to complete
-      for future in futures:
-          future.result()  # This will raise any exceptions caught during execution
+  plan = plan_copies(src_files, dst_set, args)
+  if args.dry_run:
+      report_plan(plan)
+      if args.delete or args.delete_after:
+          to_delete = fm.files_not_in_source(src_files, dst_files)
+          for file in to_delete:
+              logging.info(f"Would delete {file}")
+          logging.info(f"Dry run: {len(to_delete)} files not in the source to delete.")
+      return
+
+  sizes = [op.size for op in plan]
+  workers = args.jobs or pick_workers(sizes)
+  # Resolved here, as auto depends on what is left to copy
+  policy.io_backend = pick_backend(args.io_backend, args.progress, sizes)
+
+  # With --io-backend processes the threads only compare the files and
+  # wait on these workers for the copies
+  copier = None
+  if policy.io_backend == "processes":
+      copier = ProcessPoolExecutor(max_workers=min(workers, os.cpu_count() or 1),
+                                   mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=Logger.setup_logging,
+                                   initargs=(args.verbose,))
+
+  # Hashing is CPU bound, so it runs in its own processes, keeping that CPU
+  # time off the copy threads while they keep the disks busy. Workers are
+  # spawned rather than forked, as the copy threads are already running
+  # when they start.
+  hasher = None
+  if any(op.needs_hash for op in plan):
+      hasher = ProcessPoolExecutor(max_workers=os.cpu_count(),
+                                   mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=Logger.setup_logging,
+                                   initargs=(args.verbose,))
+
+  ops = make_dst_dirs(plan, policy)
+  if policy.io_backend == "iouring":
+      # Each thread hands its ring whole batches, so the files of a batch
+      # are copied side by side instead of one splice at a time
+      workers = min(workers, IOURING_THREADS)
+      task = partial(copy_batch, policy=policy, hash_algo=args.hash_algo, hasher=hasher)
+      ops = in_batches(ops, iouring_backend.IN_FLIGHT)
+  else:
+      task = partial(run_copy, policy=policy, hash_algo=args.hash_algo,
+                     hasher=hasher, copier=copier)
+  try:
+      # Use ThreadPoolExecutor to manage a pool of threads
+      with ThreadPoolExecutor(max_workers=workers) as executor:
+          for _ in run_bounded(executor, task, ops, workers * QUEUED_PER_WORKER):
+              pass
+  finally:
+      for pool in (hasher, copier):
+          if pool is not None:
+              pool.shutdown()
 
   if args.delete_after:
       fm.remove_files_not_in_source(src_files, dst_files)
       fm.remove_empty_folders()
   
-def copy_file_(src_file, dst_file, args):
-  """Copy a file from source to destination with attributes."""
-  fm = FileManager(src_file, 
-                   dst_file, 
-                   root_dir = args.dst,
-                   preserve_permissions=args.attribute,
-                   group=get_uid_gid(args.chown)[1] if args.chown else None,
-                   owner=get_uid_gid(args.chown)[0] if args.chown else None,
-                   status_bar=args.progress)
+def copy_file_(src_entry, dst_file, policy, copier=None):
+  """
+  Copy a file from source to destination with attributes, as set by policy.
+
+  With the processes backend the copy runs in the copier process pool.
+  The iouring backend copies whole batches instead, see copy_batch.
+  """
+  if copier is not None:
+      # DirEntry cannot be pickled, so the worker stats the source itself
+      copier.submit(copy_path, src_entry.path, dst_file, policy).result()
+      return
 
-  fm.copy_file()
+  policy.manager(src_entry.path, dst_file, src_entry.stat()).copy_file()
+
+
+def copy_path(src_file, dst_file, policy):
+  """
+  Copy a file by path, as set by policy.
+
+  Kept at module level so that it can be sent to a worker process.
+  """
+  policy.manager(src_file, dst_file).copy_file()
+
+
+def pick_backend(io_backend, progress, sizes):
+  """
+  Resolve --io-backend to the backend actually used, from the sizes of the files to copy.
+
+  auto picks io_uring when the average file is small: such copies are
+  bound by the open/close round trips io_uring overlaps across a whole
+  batch. Larger files are left to the threads, which keep the
+  copy_file_range reflinks and O_NOATIME reads the ring gives up. The
+  io_uring path has no per-file progress bars, so --progress falls back
+  to threads.
+  """
+  if io_backend == "auto":
+      if progress or not sizes or not iouring_backend.available():
+          return "threads"
+      average_size = sum(sizes) / len(sizes)
+      backend = "iouring" if average_size < SMALL_FILE_SIZE else "threads"
+      logging.debug("Average file size %d bytes, copying with %s", average_size, backend)
+      return backend
+  if io_backend == "iouring" and not iouring_backend.available():
+      logging.warning("io_uring is not available, copying with threads.")
+      return "threads"
+  if io_backend == "iouring" and progress:
+      logging.warning("--progress is not supported with io_uring, copying with threads.")
+      return "threads"
+  return io_backend
 
 
 
@@ -108,22 +544,40 @@ def main():
   args = parse_arguments()
   Logger.setup_logging(args.verbose)
   validate_folders(args.src, args.dst)
+  if args.hash_chk and not HashChecker.is_available(args.hash_algo):
+      logging.warning(f"{args.hash_algo} is not installed, falling back to md5 for --hash-chk.")
+      args.hash_algo = "md5"
+  # Destination paths are matched as strings against the listed ones
+  args.src = os.path.normpath(args.src)
+  args.dst = os.path.normpath(args.dst)
+  # Every listed source path is the source root, a separator and the
+  # relative path, so swapping roots is a slice and a concatenation
+  args.src_prefix_len = len(args.src.rstrip(os.sep))
+  args.dst_root = args.dst.rstrip(os.sep)
+  # Resolved once here instead of for every copied file
+  uid, gid = resolve_owner(args.chown)
+  policy = CopyPolicy(root_dir=args.dst,
+                      preserve_permissions=args.attribute,
+                      owner=uid,
+                      group=gid,
+                      status_bar=args.progress,
+                      io_backend=args.io_backend)
 
   
   try:
       
       logging.info("Starting the synchronization process...")
       start_time = time.time()  # Record the start time
-      src_files = list_files_recursively(args.src)
-      
-      if args.delete or args.delete_after:
-        dst_files = list_files_recursively(args.dst)
-      else:
-        dst_files = None
+      # Streamed, so that planning compares files while the source is still
+      # being read; copies start once the whole plan has been built
+      # Folders unchanged since the last run are listed from the manifests,
+      # which a dry run reads but leaves as they are
+      src_files = iter_files_recursively(args.src, manifest=Manifest(args.src, args.full_scan, read_only=args.dry_run))
+      # Needed to tell which files already exist there, not only for --delete
+      dst_files = list_files_recursively(args.dst, manifest=Manifest(args.dst, args.full_scan, read_only=args.dry_run))
 
-      synchronize_files(args, src_files, dst_files)
-      if (args.chown is not None):
-        ch_own(args.dst, args.chown)
+      # Copied files and their folders get the --chown ids as they are written
+      synchronize_files(args, policy, src_files, dst_files)
 
       end_time = time.time()  # Record the end time
       elapsed_time = end_time - start_time
@@ -134,6 +588,10 @@ def main():
   except KeyboardInterrupt:
       logging.info("Operation cancelled by user.")
       sys.exit(0)
+  except OSError as e:
+      # Raised by a copy when the destination is full; the rest was cancelled
+      logging.error(f"Synchronization stopped: {e}")
+      sys.exit(1)
 
 if __name__ == "__main__":
   main()